@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+
+from fastapi import HTTPException
+
+# ==========================================
+# CONFIGURACIÓN (variables de entorno)
+# ==========================================
+LIMITE_CONCURRENTES = int(os.getenv("LIMITE_CONCURRENTES", 8))
+LIMITE_EN_COLA = int(os.getenv("LIMITE_EN_COLA", 32))
+LIMITE_ESPERA_SEG = float(os.getenv("LIMITE_ESPERA_SEG", 2.0))
+RETRY_AFTER_SEG = int(os.getenv("RETRY_AFTER_SEG", 1))
+
+
+# ==========================================
+# SINGLE-FLIGHT (coalescencia de lecturas)
+# ==========================================
+class _Llamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: solo la primera
+    ejecuta la función, el resto espera y recibe el mismo resultado.
+    No cachea nada: al terminar la llamada, la siguiente vuelve a ejecutar.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self.ejecuciones = 0
+
+    def hacer(self, clave, fn):
+        with self._lock:
+            llamada = self._en_vuelo.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = _Llamada()
+                self._en_vuelo[clave] = llamada
+                self.ejecuciones += 1
+
+        if not lider:
+            llamada.evento.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = fn()
+        except Exception as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+            llamada.evento.set()
+        return llamada.resultado
+
+
+single_flight = SingleFlight()
+
+
+# ==========================================
+# CONTROL DE ADMISIÓN (límite por ruta)
+# ==========================================
+class LimiteConcurrencia:
+    """
+    Limita las peticiones simultáneas de una ruta. Si no hay cupo, la
+    petición espera en una cola acotada; si la cola está llena o la espera
+    supera `espera_max`, se rechaza con 503 y cabecera Retry-After.
+    Se usa como dependencia de la ruta (`dependencies=[Depends(limite)]`):
+    se evalúa en el event loop, antes de ocupar un hilo del threadpool, y el
+    cupo se libera al terminar el handler.
+    """
+
+    def __init__(self, nombre, max_concurrentes=LIMITE_CONCURRENTES,
+                 max_en_cola=LIMITE_EN_COLA, espera_max=LIMITE_ESPERA_SEG,
+                 retry_after=RETRY_AFTER_SEG):
+        self.nombre = nombre
+        self.max_concurrentes = max_concurrentes
+        self.max_en_cola = max_en_cola
+        self.espera_max = espera_max
+        self.retry_after = retry_after
+        self._loop = None
+        self._sem = None
+        self._en_cola = 0
+        self.rechazadas = 0
+
+    def _semaforo(self):
+        # El semáforo se crea en el loop que atiende la petición: un segundo
+        # loop en el mismo proceso (reload, otro TestClient) tendrá el suyo
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._sem = asyncio.Semaphore(self.max_concurrentes)
+        return self._sem
+
+    def _rechazo(self):
+        self.rechazadas += 1
+        return HTTPException(
+            status_code=503,
+            detail=f"Servicio saturado ({self.nombre}), intente nuevamente",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def entrar(self):
+        sem = self._semaforo()
+        if not sem.locked():
+            await sem.acquire()
+            return sem
+        if self._en_cola >= self.max_en_cola:
+            raise self._rechazo()
+        self._en_cola += 1
+        try:
+            await asyncio.wait_for(sem.acquire(), self.espera_max)
+        except asyncio.TimeoutError:
+            raise self._rechazo()
+        finally:
+            self._en_cola -= 1
+        return sem
+
+    async def __call__(self):
+        sem = await self.entrar()
+        try:
+            yield
+        finally:
+            sem.release()
@@ -1,4 +1,7 @@
 from bson import ObjectId, errors
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from perfilado import medir
 
 def to_json(document):
     """
@@ -7,13 +10,14 @@ def to_json(document):
     """
     if not document:
         return {}
-    result = {}
-    for key, value in document.items():
-        if isinstance(value, ObjectId):
-            result[key] = str(value)
-        else:
-            result[key] = value
-    return result
+    with medir("serializacion"):
+        result = {}
+        for key, value in document.items():
+            if isinstance(value, ObjectId):
+                result[key] = str(value)
+            else:
+                result[key] = value
+        return result
 
 
 def get_by_id(collection, id):
@@ -60,3 +64,48 @@ def delete_document(collection, id):
         return 0
     result = collection.delete_one({"_id": oid})
     return result.deleted_count
+
+
+def revertir_venta(productos_col, ventas_col, venta):
+    """
+    Marca la venta como rechazada y devuelve el stock de los productos que
+    aún tienen su marca en "ventas_pendientes". Es idempotente.
+    Retorna False si la venta ya estaba completada (no se toca el stock).
+    """
+    venta_id = venta["_id"]
+    res = ventas_col.update_one(
+        {"_id": venta_id, "estado": {"$in": ["pendiente", "rechazada"]}},
+        {"$set": {"estado": "rechazada"}},
+    )
+    if res.matched_count == 0:
+        return False
+    productos_col.bulk_write([
+        UpdateOne(
+            {"_id": item["id_producto"], "ventas_pendientes": venta_id},
+            {"$inc": {"stock": item["cantidad"]}, "$pull": {"ventas_pendientes": venta_id}},
+        )
+        for item in venta["items"]
+    ], ordered=False)
+    return True
+
+
+def reconciliar_ventas(productos_col, ventas_col, antiguedad_min=10):
+    """
+    Repara ventas que quedaron a medias por una caída entre pasos:
+    revierte las pendientes más antiguas que `antiguedad_min` y limpia las
+    marcas que quedaron en productos de ventas ya cerradas.
+    Retorna el número de ventas revertidas.
+    """
+    limite = (datetime.now() - timedelta(minutes=antiguedad_min)).isoformat()
+    revertidas = 0
+    for venta in ventas_col.find({"estado": "pendiente", "fecha": {"$lt": limite}}):
+        if revertir_venta(productos_col, ventas_col, venta):
+            revertidas += 1
+
+    marcas = productos_col.distinct("ventas_pendientes")
+    for venta in ventas_col.find({"_id": {"$in": marcas}, "estado": {"$ne": "pendiente"}}):
+        if venta["estado"] == "completada":
+            productos_col.update_many({"ventas_pendientes": venta["_id"]}, {"$pull": {"ventas_pendientes": venta["_id"]}})
+        else:
+            revertir_venta(productos_col, ventas_col, venta)
+    return revertidas
@@ -2,6 +2,7 @@ from pymongo import MongoClient
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
+from perfilado import escucha_mongo, instrumentar_sql
 
 # ==========================================
 # 1. CONFIGURACIÓN MONGODB (Negocio + Login)
@@ -13,7 +14,7 @@ MONGO_URL = os.getenv(
 MONGO_DB = os.getenv("MONGO_DB", "test")
 
 try:
-    client = MongoClient(MONGO_URL)
+    client = MongoClient(MONGO_URL, event_listeners=[escucha_mongo])
     db = client[MONGO_DB]
     print("Conexión a MongoDB exitosa")
 except Exception as e:
@@ -29,10 +30,11 @@ if db is not None:
     disponibilidades_col = db["disponibilidades"]
     notificaciones_col = db["notificaciones"]
     jefes_col = db["jefes"] 
+    ventas_col = db["ventas"]
     # Clientes está en MySQL, no aquí
     clientes_col = None 
 else:
-    barberos_col = servicios_col = productos_col = reservas_col = jefes_col = clientes_col = None
+    barberos_col = servicios_col = productos_col = reservas_col = jefes_col = clientes_col = ventas_col = None
 
 # ==========================================
 # 2. CONFIGURACIÓN MYSQL (Solo Clientes)
@@ -48,6 +50,7 @@ SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PO
 try:
     # pool_pre_ping ayuda a mantener la conexión estable
     engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+    instrumentar_sql(engine)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     Base = declarative_base()
     print(f"Motor SQL (Clientes) configurado hacia: {DB_HOST}:{DB_PORT}")
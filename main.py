@@ -1,6 +1,10 @@
-from fastapi import FastAPI, HTTPException, Body, Depends
+from fastapi import FastAPI, HTTPException, Body, Depends, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, FileResponse
 from bson import ObjectId, errors
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 from typing import Optional
@@ -9,15 +13,18 @@ import os
 # SQL Imports
 from sqlalchemy.orm import Session
 from database import (
-    db, barberos_col, servicios_col, productos_col, reservas_col, jefes_col,
+    db, barberos_col, servicios_col, productos_col, reservas_col, jefes_col, ventas_col,
     get_db_sql, ClienteSQL
 )
 # CRUD Mongo
-from crud import to_json, insert_document, update_document, delete_document
+from crud import to_json, insert_document, update_document, delete_document, revertir_venta
 from scheduler import iniciar_scheduler
-from schemas import BarberoSchema
+from schemas import BarberoSchema, VentaSchema
+from concurrencia import single_flight, LimiteConcurrencia
+from perfilado import perfilar_peticion, medir, listar_capturas, ruta_captura, secreto_valido, RutaPerfilada
 
 app = FastAPI(title="API Barbería Híbrida", version="2.6.0")
+app.router.route_class = RutaPerfilada
 
 # CORS
 origins = ["*"]
@@ -29,6 +36,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado por petición (cabecera X-Perfil, muestreo y peticiones lentas)
+app.middleware("http")(perfilar_peticion)
+
+# Control de admisión para las lecturas más consultadas
+limite_barberos = LimiteConcurrencia("barberos")
+limite_servicios = LimiteConcurrencia("servicios")
+
+def respuesta_compartida(clave, fn):
+    # Las peticiones idénticas y simultáneas comparten la consulta y el JSON ya serializado
+    body = single_flight.hacer(clave, lambda: _serializar(fn()))
+    return Response(content=body, media_type="application/json")
+
+def _serializar(datos):
+    with medir("serializacion"):
+        return JSONResponse(content=jsonable_encoder(datos)).body
+
 @app.on_event("startup")
 def startup_event():
     iniciar_scheduler()
@@ -86,8 +109,11 @@ def login(datos_login: LoginSchema):
 # ==========================================
 # BARBEROS (MONGODB)
 # ==========================================
-@app.get("/barberos/")
+@app.get("/barberos/", dependencies=[Depends(limite_barberos)])
 def listar_barberos():
+    return respuesta_compartida("barberos", _consultar_barberos)
+
+def _consultar_barberos():
     lista = []
     if barberos_col is not None:
         for b in barberos_col.find():
@@ -315,10 +341,10 @@ def eliminar_reserva(reserva_id: str):
 # ==========================================
 # SERVICIOS (MONGODB) - ¡CORREGIDO!
 # ==========================================
-@app.get("/servicios/")
+@app.get("/servicios/", dependencies=[Depends(limite_servicios)])
 def listar_servicios():
     # Devuelve todos los campos (nombre_servicio, precio, duracion)
-    return [to_json(s) for s in servicios_col.find()]
+    return respuesta_compartida("servicios", lambda: [to_json(s) for s in servicios_col.find()])
 
 @app.post("/servicios/")
 def crear_servicio(s: dict = Body(...)):
@@ -338,7 +364,97 @@ def eliminar_servicio(sid: str):
 # ==========================================
 @app.get("/productos/")
 def listar_productos():
-    return [to_json(p) for p in productos_col.find()]
+    return [to_json(p) for p in productos_col.find({}, {"ventas_pendientes": 0})]
+
+# ==========================================
+# VENTAS (MONGODB)
+# ==========================================
+@app.post("/ventas/")
+def crear_venta(venta: VentaSchema):
+    if not venta.items:
+        raise HTTPException(status_code=400, detail="El carrito está vacío")
+
+    # 1. Agrupar cantidades por producto
+    cantidades = {}
+    try:
+        for item in venta.items:
+            oid = ObjectId(item.id_producto)
+            cantidades[oid] = cantidades.get(oid, 0) + item.cantidad
+    except errors.InvalidId:
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    productos = {p["_id"]: p for p in productos_col.find({"_id": {"$in": list(cantidades)}})}
+    faltantes = [str(oid) for oid in cantidades if oid not in productos]
+    if faltantes:
+        raise HTTPException(status_code=404, detail=f"Productos no encontrados: {faltantes}")
+
+    detalle = [
+        {
+            "id_producto": oid,
+            "nombre_producto": productos[oid].get("nombre_producto"),
+            "cantidad": cant,
+            "precio_unitario": productos[oid].get("precio", 0),
+            "subtotal": productos[oid].get("precio", 0) * cant,
+        }
+        for oid, cant in cantidades.items()
+    ]
+    venta_id = ObjectId()
+    doc = {
+        "_id": venta_id,
+        "items": detalle,
+        "total": sum(d["subtotal"] for d in detalle),
+        "fecha": datetime.now().isoformat(),
+        "estado": "pendiente",
+    }
+
+    try:
+        ventas_col.insert_one(doc)
+
+        # 2. Descontar stock: cada update solo aplica si hay stock suficiente ($inc atómico).
+        #    La marca en "ventas_pendientes" permite saber qué productos se descontaron.
+        res = productos_col.bulk_write([
+            UpdateOne(
+                {"_id": oid, "stock": {"$gte": cant}},
+                {"$inc": {"stock": -cant}, "$push": {"ventas_pendientes": venta_id}},
+            )
+            for oid, cant in cantidades.items()
+        ], ordered=False)
+
+        if res.modified_count == len(cantidades):
+            # Solo se completa si sigue pendiente (reconciliar_ventas pudo haberla revertido)
+            completada = ventas_col.update_one(
+                {"_id": venta_id, "estado": "pendiente"}, {"$set": {"estado": "completada"}}
+            )
+            if completada.modified_count == 0:
+                raise HTTPException(status_code=409, detail="La venta expiró, intente nuevamente")
+            try:
+                productos_col.update_many({"ventas_pendientes": venta_id}, {"$pull": {"ventas_pendientes": venta_id}})
+            except PyMongoError:
+                pass  # la venta ya está completada; reconciliar_ventas limpia las marcas
+            return {"mensaje": "Venta registrada", "id_venta": str(venta_id)}
+
+        # 3. Carrito incompleto: devolver el stock de los productos ya descontados
+        descontados = {p["_id"] for p in productos_col.find({"ventas_pendientes": venta_id}, {"_id": 1})}
+        revertir_venta(productos_col, ventas_col, doc)
+    except PyMongoError as e:
+        print(f"Error MongoDB en venta {venta_id}: {e}")
+        try:
+            revertir_venta(productos_col, ventas_col, doc)
+        except PyMongoError:
+            pass  # queda pendiente; reconciliar_ventas la revierte
+        raise HTTPException(status_code=503, detail="Error de base de datos, la venta no se registró")
+
+    sin_stock = [str(oid) for oid in cantidades if oid not in descontados]
+    raise HTTPException(status_code=409, detail=f"Stock insuficiente: {sin_stock}")
+
+@app.get("/ventas/")
+def listar_ventas():
+    ventas = []
+    for v in ventas_col.find({"estado": "completada"}):
+        data = to_json(v)
+        data["items"] = [to_json(i) for i in v.get("items", [])]
+        ventas.append(data)
+    return ventas
 
 # ==========================================
 # AGENDA BARBERO (PANEL)
@@ -366,6 +482,24 @@ def get_historial_barbero(barbero_id: str):
     except errors.InvalidId:
         raise HTTPException(status_code=400, detail="ID inválido")
 
+# ==========================================
+# PERFILES (DIAGNÓSTICO)
+# ==========================================
+@app.get("/perfiles/")
+def listar_perfiles(x_perfil: Optional[str] = Header(None)):
+    if not secreto_valido(x_perfil):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return listar_capturas()
+
+@app.get("/perfiles/{nombre}")
+def descargar_perfil(nombre: str, x_perfil: Optional[str] = Header(None)):
+    if not secreto_valido(x_perfil):
+        raise HTTPException(status_code=403, detail="No autorizado")
+    ruta = ruta_captura(nombre)
+    if not ruta:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(ruta, media_type="application/json", filename=nombre)
+
 if __name__ == "__main__":
     import uvicorn
     PORT = int(os.environ.get("PORT", 8000))
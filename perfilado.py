@@ -0,0 +1,354 @@
+import contextvars
+import functools
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from pymongo import monitoring
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.background import BackgroundTask
+
+# ==========================================
+# CONFIGURACIÓN (variables de entorno)
+# ==========================================
+PERFIL_SECRETO = os.getenv("PERFIL_SECRETO")          # valor de la cabecera X-Perfil
+PERFIL_MUESTREO = float(os.getenv("PERFIL_MUESTREO", 0))   # 0..1
+PERFIL_UMBRAL_MS = float(os.getenv("PERFIL_UMBRAL_MS", 1000))
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", 5))
+PERFIL_DIR = os.getenv("PERFIL_DIR", "perfiles")
+PERFIL_MAX_ARCHIVOS = int(os.getenv("PERFIL_MAX_ARCHIVOS", 200))
+
+CABECERA_PERFIL = "X-Perfil"
+RUTAS_EXCLUIDAS = ("/perfiles",)   # listar/descargar capturas no genera capturas nuevas
+
+_perfil_actual = contextvars.ContextVar("perfil_actual", default=None)
+
+
+# ==========================================
+# MEDICIÓN POR FASES
+# ==========================================
+class PerfilPeticion:
+    """
+    Acumula el tiempo por fase de una petición y, si está activo, las
+    muestras del perfilador. Las fases no se solapan:
+      - validacion: dependencias y validación del request (pydantic)
+      - handler: tiempo propio del endpoint, sin BD ni serialización
+      - db_mongo / db_mysql: consultas
+      - serializacion: to_json y codificación/render de la respuesta
+    Se muestrea el hilo del event loop solo mientras ejecuta la validación y
+    la serialización de esta petición, y el hilo del threadpool mientras
+    ejecuta el endpoint.
+    """
+
+    def __init__(self, metodo, ruta):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.fases = defaultdict(float)
+        self.hilos = set()
+        self.muestras = Counter()
+        self._lock = threading.Lock()
+        self._hilo_loop = None
+        self._t_ruta = None
+        self._t_fin_endpoint = None
+
+    def sumar(self, fase, segundos):
+        with self._lock:
+            self.fases[fase] += segundos
+
+    def _total_fases(self):
+        with self._lock:
+            return sum(self.fases.values())
+
+    def _cambiar_hilo(self, quitar, agregar):
+        with self._lock:
+            self.hilos.discard(quitar)
+            if agregar is not None:
+                self.hilos.add(agregar)
+
+    def inicio_ruta(self):
+        self._t_ruta = time.perf_counter()
+        self._hilo_loop = threading.get_ident()
+        self._cambiar_hilo(None, self._hilo_loop)
+
+    def inicio_endpoint(self):
+        ahora = time.perf_counter()
+        if self._t_ruta is not None:
+            self.sumar("validacion", ahora - self._t_ruta)
+        self._cambiar_hilo(self._hilo_loop, threading.get_ident())
+        return ahora, self._total_fases()
+
+    def fin_endpoint(self, t0, fases0):
+        ahora = time.perf_counter()
+        anidadas = self._total_fases() - fases0
+        self.sumar("handler", max(ahora - t0 - anidadas, 0))
+        self._t_fin_endpoint = ahora
+        self._cambiar_hilo(threading.get_ident(), self._hilo_loop)
+
+    def fin_ruta(self):
+        ahora = time.perf_counter()
+        if self._t_fin_endpoint is None:
+            # Rechazada antes de llegar al endpoint (422, 503 de admisión...)
+            self.sumar("validacion", ahora - self._t_ruta)
+        else:
+            self.sumar("serializacion", ahora - self._t_fin_endpoint)
+        self._cambiar_hilo(self._hilo_loop, None)
+
+
+@contextmanager
+def medir(fase):
+    perfil = _perfil_actual.get()
+    if perfil is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.sumar(fase, time.perf_counter() - t0)
+
+
+class EscuchaMongo(monitoring.CommandListener):
+    """Suma la duración de cada comando MongoDB a la petición en curso."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        perfil = _perfil_actual.get()
+        if perfil is not None:
+            perfil.sumar("db_mongo", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+escucha_mongo = EscuchaMongo()
+
+
+def instrumentar_sql(engine):
+    """Registra en el engine los eventos que miden el tiempo de MySQL."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        perfil = _perfil_actual.get()
+        if perfil is not None:
+            conn.info.setdefault("perfil_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        perfil = _perfil_actual.get()
+        if perfil is not None and conn.info.get("perfil_t0"):
+            perfil.sumar("db_mysql", time.perf_counter() - conn.info["perfil_t0"].pop())
+
+
+# ==========================================
+# PERFILADOR POR MUESTREO
+# ==========================================
+def _medir_endpoint(fn):
+    """
+    Envuelve el endpoint para medir su tiempo propio y muestrear el hilo
+    que lo ejecuta (threadpool o event loop) desde la primera línea.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def envoltura_async(*args, **kwargs):
+            perfil = _perfil_actual.get()
+            if perfil is None:
+                return await fn(*args, **kwargs)
+            t0, fases0 = perfil.inicio_endpoint()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                perfil.fin_endpoint(t0, fases0)
+        return envoltura_async
+
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        perfil = _perfil_actual.get()
+        if perfil is None:
+            return fn(*args, **kwargs)
+        t0, fases0 = perfil.inicio_endpoint()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            perfil.fin_endpoint(t0, fases0)
+    return envoltura
+
+
+class RutaPerfilada(APIRoute):
+    """
+    Ruta que separa la validación, el endpoint y la serialización de la
+    respuesta, que FastAPI ejecuta en el event loop.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _medir_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        manejador = super().get_route_handler()
+
+        async def app(request):
+            perfil = _perfil_actual.get()
+            if perfil is None:
+                return await manejador(request)
+            perfil.inicio_ruta()
+            try:
+                return await manejador(request)
+            finally:
+                perfil.fin_ruta()
+        return app
+
+
+class Muestreador(threading.Thread):
+    """
+    Toma cada PERFIL_INTERVALO_MS la pila de los hilos que atienden la
+    petición y la acumula en formato "collapsed" (compatible con flamegraph).
+    """
+
+    def __init__(self, perfil):
+        super().__init__(daemon=True)
+        self.perfil = perfil
+        self._parar = threading.Event()
+
+    def run(self):
+        intervalo = PERFIL_INTERVALO_MS / 1000
+        while not self._parar.wait(intervalo):
+            frames = sys._current_frames()
+            with self.perfil._lock:
+                hilos = list(self.perfil.hilos)
+            for ident in hilos:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.perfil.muestras[_pila(frame)] += 1
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+
+
+def _pila(frame):
+    partes = []
+    while frame is not None:
+        codigo = frame.f_code
+        partes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+# ==========================================
+# CAPTURAS EN DISCO
+# ==========================================
+def _nombre_captura(perfil):
+    ruta = re.sub(r"[^A-Za-z0-9]+", "_", perfil.ruta).strip("_") or "raiz"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}_{perfil.metodo}_{ruta}_{uuid.uuid4().hex[:6]}.json"
+
+
+def _guardar(perfil, duracion, motivo, nombre):
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    fases = {f"{k}_ms": round(v * 1000, 2) for k, v in perfil.fases.items()}
+    # Middleware, enrutamiento y esperas del event loop fuera de la ruta
+    fases["otros_ms"] = round(max(duracion - sum(perfil.fases.values()), 0) * 1000, 2)
+    captura = {
+        "metodo": perfil.metodo,
+        "ruta": perfil.ruta,
+        "motivo": motivo,
+        "duracion_ms": round(duracion * 1000, 2),
+        "fases": fases,
+        "intervalo_ms": PERFIL_INTERVALO_MS,
+        "muestras": dict(perfil.muestras.most_common()),
+    }
+    with open(os.path.join(PERFIL_DIR, nombre), "w", encoding="utf-8") as f:
+        json.dump(captura, f, ensure_ascii=False, indent=2)
+
+    # Mantener acotado el directorio: se borran las capturas más antiguas
+    archivos = sorted(listar_capturas(), key=lambda a: a["creado"])
+    for a in archivos[:max(len(archivos) - PERFIL_MAX_ARCHIVOS, 0)]:
+        os.remove(os.path.join(PERFIL_DIR, a["nombre"]))
+
+
+def _guardar_seguro(perfil, duracion, motivo, nombre):
+    try:
+        _guardar(perfil, duracion, motivo, nombre)
+    except OSError as e:
+        print("Error guardando perfil:", e)
+
+
+def listar_capturas():
+    if not os.path.isdir(PERFIL_DIR):
+        return []
+    capturas = []
+    for nombre in os.listdir(PERFIL_DIR):
+        if nombre.endswith(".json"):
+            st = os.stat(os.path.join(PERFIL_DIR, nombre))
+            capturas.append({"nombre": nombre, "bytes": st.st_size, "creado": st.st_mtime})
+    return sorted(capturas, key=lambda a: a["creado"], reverse=True)
+
+
+def ruta_captura(nombre):
+    """Retorna la ruta del archivo o None si el nombre no es una captura válida."""
+    if os.path.basename(nombre) != nombre or not nombre.endswith(".json"):
+        return None
+    ruta = os.path.join(PERFIL_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+
+def secreto_valido(valor):
+    if not PERFIL_SECRETO or valor is None:
+        return False
+    return hmac.compare_digest(valor.encode(), PERFIL_SECRETO.encode())
+
+
+# ==========================================
+# MIDDLEWARE
+# ==========================================
+async def perfilar_peticion(request, call_next):
+    """
+    Mide todas las peticiones por fase. Se perfila por muestreo cuando llega
+    la cabecera X-Perfil con el secreto o cuando toca según PERFIL_MUESTREO.
+    Se guarda la captura si se perfiló o si se superó PERFIL_UMBRAL_MS; la
+    escritura se hace después de enviar la respuesta.
+    """
+    if request.url.path.startswith(RUTAS_EXCLUIDAS):
+        return await call_next(request)
+
+    perfil = PerfilPeticion(request.method, request.url.path)
+    token = _perfil_actual.set(perfil)
+
+    motivo = None
+    if secreto_valido(request.headers.get(CABECERA_PERFIL)):
+        motivo = "cabecera"
+    elif PERFIL_MUESTREO > 0 and random.random() < PERFIL_MUESTREO:
+        motivo = "muestreo"
+
+    muestreador = None
+    if motivo:
+        muestreador = Muestreador(perfil)
+        muestreador.start()
+
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        duracion = time.perf_counter() - t0
+        if muestreador:
+            muestreador.detener()
+        _perfil_actual.reset(token)
+
+    if motivo is None and duracion * 1000 >= PERFIL_UMBRAL_MS:
+        motivo = "lenta"
+    if motivo:
+        nombre = _nombre_captura(perfil)
+        response.background = BackgroundTask(_guardar_seguro, perfil, duracion, motivo, nombre)
+        if motivo == "cabecera":
+            response.headers["X-Perfil-Captura"] = nombre
+    return response
@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 # Importamos SessionLocal y ClienteSQL para acceder a MySQL
-from database import reservas_col, SessionLocal, ClienteSQL
+from database import reservas_col, productos_col, ventas_col, SessionLocal, ClienteSQL
 from email_utils import enviar_correo_recordatorio
+from crud import reconciliar_ventas
 
 scheduler = BackgroundScheduler()
 
@@ -43,7 +44,17 @@ def chequear_reservas_proximas():
     finally:
         db_sql.close()
 
+def reconciliar_ventas_pendientes():
+    try:
+        revertidas = reconciliar_ventas(productos_col, ventas_col)
+        if revertidas:
+            print(f"Ventas pendientes revertidas: {revertidas}")
+    except Exception as e:
+        print(f"Error reconciliando ventas: {e}")
+
 def iniciar_scheduler():
     if not scheduler.running:
         scheduler.add_job(chequear_reservas_proximas, "interval", minutes=60)
+        # Se ejecuta al iniciar y luego cada 5 minutos
+        scheduler.add_job(reconciliar_ventas_pendientes, "interval", minutes=5, next_run_time=datetime.now())
         scheduler.start()
\ No newline at end of file
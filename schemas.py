@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import date
 
@@ -35,6 +35,13 @@ class ProductoSchema(BaseModel):
     stock: int
     id_jefe: Optional[str] = None
 
+class ItemVentaSchema(BaseModel):
+    id_producto: str
+    cantidad: int = Field(gt=0)
+
+class VentaSchema(BaseModel):
+    items: List[ItemVentaSchema]
+
 class ReservaSchema(BaseModel):
     id_cliente: str
     id_barbero: str
@@ -0,0 +1,70 @@
+"""
+Ráfaga de lecturas concurrentes contra GET /barberos/.
+
+Compara cuántas consultas llegan a MongoDB con y sin single-flight, y
+cuántas peticiones se rechazan con 503 por el control de admisión.
+La colección se reemplaza por una falsa que tarda CONSULTA_MS en responder.
+
+Uso (desde la raíz del repo):
+    python scripts/bench_concurrencia.py [peticiones] [hilos]
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.testclient import TestClient
+
+import main
+
+CONSULTA_MS = 50
+
+
+class BarberosLentos:
+    def __init__(self):
+        self.consultas = 0
+        self._lock = threading.Lock()
+
+    def find(self, *args, **kwargs):
+        with self._lock:
+            self.consultas += 1
+        time.sleep(CONSULTA_MS / 1000)
+        return [{"_id": i, "nombre": f"Barbero {i}", "usuario": f"b{i}"} for i in range(20)]
+
+
+class SinCoalescencia:
+    def hacer(self, clave, fn):
+        return fn()
+
+
+def rafaga(client, peticiones, hilos):
+    with ThreadPoolExecutor(hilos) as ex:
+        return Counter(ex.map(lambda _: client.get("/barberos/").status_code, range(peticiones)))
+
+
+def main_bench(peticiones=200, hilos=40):
+    original_col, original_sf = main.barberos_col, main.single_flight
+    original_scheduler = main.iniciar_scheduler
+    # El startup no debe lanzar los jobs del scheduler contra la base configurada
+    main.iniciar_scheduler = lambda: None
+    try:
+        with TestClient(main.app) as client:
+            for etiqueta, sf in (("sin single-flight", SinCoalescencia()), ("con single-flight", original_sf)):
+                col = BarberosLentos()
+                main.barberos_col, main.single_flight = col, sf
+                t0 = time.perf_counter()
+                estados = rafaga(client, peticiones, hilos)
+                ms = (time.perf_counter() - t0) * 1000
+                print(f"{etiqueta}: {peticiones} peticiones -> {col.consultas} consultas a Mongo, "
+                      f"respuestas {dict(estados)}, {ms:.0f} ms")
+    finally:
+        main.barberos_col, main.single_flight = original_col, original_sf
+        main.iniciar_scheduler = original_scheduler
+
+
+if __name__ == "__main__":
+    main_bench(*(int(a) for a in sys.argv[1:3]))
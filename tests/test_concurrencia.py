@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from concurrencia import SingleFlight, LimiteConcurrencia
+
+
+def test_single_flight_agrupa_llamadas_concurrentes():
+    sf = SingleFlight()
+    llamadas = []
+    lock = threading.Lock()
+
+    def consulta():
+        with lock:
+            llamadas.append(1)
+        time.sleep(0.05)
+        return [1, 2, 3]
+
+    with ThreadPoolExecutor(20) as ex:
+        resultados = list(ex.map(lambda _: sf.hacer("barberos", consulta), range(100)))
+
+    assert all(r == [1, 2, 3] for r in resultados)
+    assert len(llamadas) == sf.ejecuciones
+    # 20 hilos x 100 llamadas de 50 ms: ~5 oleadas, una ejecución por oleada
+    assert len(llamadas) <= 10
+
+
+def test_single_flight_propaga_errores():
+    sf = SingleFlight()
+
+    def falla():
+        raise RuntimeError("mongo caído")
+
+    with pytest.raises(RuntimeError):
+        sf.hacer("servicios", falla)
+    assert sf.hacer("servicios", lambda: "ok") == "ok"
+
+
+def test_limite_rechaza_con_503_cuando_la_cola_esta_llena():
+    limite = LimiteConcurrencia("test", max_concurrentes=1, max_en_cola=0)
+
+    async def escenario():
+        sem = await limite.entrar()
+        with pytest.raises(HTTPException) as exc:
+            await limite.entrar()
+        sem.release()
+        return exc.value
+
+    error = asyncio.run(escenario())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == str(limite.retry_after)
+
+
+def test_limite_funciona_en_varios_event_loops():
+    limite = LimiteConcurrencia("test", max_concurrentes=1, max_en_cola=1, espera_max=0.5)
+
+    async def escenario():
+        sem = await limite.entrar()
+        espera = asyncio.create_task(limite.entrar())
+        await asyncio.sleep(0.01)
+        sem.release()
+        (await espera).release()
+
+    # Un segundo loop (reload, otro TestClient) no debe heredar el semáforo del primero
+    asyncio.run(escenario())
+    asyncio.run(escenario())
+
+
+def test_limite_como_dependencia_de_ruta():
+    app = FastAPI()
+    lleno = LimiteConcurrencia("lleno", max_concurrentes=0, max_en_cola=0)
+    libre = LimiteConcurrencia("libre", max_concurrentes=1, max_en_cola=0)
+
+    @app.get("/lleno", dependencies=[Depends(lleno)])
+    def ruta_llena():
+        return "ok"
+
+    @app.get("/libre", dependencies=[Depends(libre)])
+    def ruta_libre():
+        return "ok"
+
+    # Un solo event loop para todas las peticiones, como en producción
+    with TestClient(app) as client:
+        r = client.get("/lleno")
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == str(lleno.retry_after)
+        # El cupo se libera al terminar: peticiones sucesivas no se rechazan
+        assert [client.get("/libre").status_code for _ in range(3)] == [200, 200, 200]
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import perfilado
+
+SECRETO = "secreto-test"
+
+
+class ServiciosLentos:
+    def find(self, *args, **kwargs):
+        time.sleep(0.05)
+        return [{"_id": "s1", "nombre_servicio": "Corte", "precio": 10000, "duracion": 30}]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(perfilado, "PERFIL_DIR", str(tmp_path))
+    monkeypatch.setattr(perfilado, "PERFIL_SECRETO", SECRETO)
+    monkeypatch.setattr(perfilado, "PERFIL_INTERVALO_MS", 1)
+    monkeypatch.setattr(main, "servicios_col", ServiciosLentos())
+    return TestClient(main.app)
+
+
+def _capturas(tmp_path):
+    return [json.loads(p.read_text(encoding="utf-8")) for p in tmp_path.glob("*.json")]
+
+
+def test_cabecera_guarda_perfil_del_hilo_del_handler(client, tmp_path):
+    r = client.get("/servicios/", headers={perfilado.CABECERA_PERFIL: SECRETO})
+    assert r.status_code == 200
+    assert (tmp_path / r.headers["X-Perfil-Captura"]).is_file()
+
+    captura, = _capturas(tmp_path)
+    assert captura["motivo"] == "cabecera"
+    assert "serializacion_ms" in captura["fases"]
+    assert {"validacion_ms", "handler_ms", "serializacion_ms"} <= set(captura["fases"])
+    assert captura["fases"]["handler_ms"] >= 40
+    assert any("main.py:listar_servicios" in p for p in captura["muestras"])
+
+
+def test_codificacion_de_la_respuesta_cuenta_como_serializacion(client, tmp_path, monkeypatch):
+    class MuchosProductos:
+        def find(self, *args, **kwargs):
+            return [{"_id": i, "nombre_producto": f"P{i}", "precio": i, "stock": 1, "tags": list(range(10))}
+                    for i in range(5000)]
+
+    monkeypatch.setattr(main, "productos_col", MuchosProductos())
+    client.get("/productos/", headers={perfilado.CABECERA_PERFIL: SECRETO})
+
+    captura, = _capturas(tmp_path)
+    fases = captura["fases"]
+    assert fases["serializacion_ms"] > fases["handler_ms"]
+    # El event loop se muestrea mientras codifica la respuesta de esta petición
+    assert any("jsonable_encoder" in p for p in captura["muestras"])
+
+
+def test_validacion_fallida_se_mide_como_validacion(client, tmp_path):
+    r = client.post("/ventas/", json={"items": "no-es-lista"}, headers={perfilado.CABECERA_PERFIL: SECRETO})
+    assert r.status_code == 422
+
+    captura, = _capturas(tmp_path)
+    assert "validacion_ms" in captura["fases"]
+    assert "handler_ms" not in captura["fases"]
+
+
+def test_peticion_lenta_se_captura_sin_cabecera(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(perfilado, "PERFIL_UMBRAL_MS", 10)
+    r = client.get("/servicios/")
+    assert r.status_code == 200
+    assert "X-Perfil-Captura" not in r.headers
+
+    captura, = _capturas(tmp_path)
+    assert captura["motivo"] == "lenta"
+    assert captura["muestras"] == {}
+
+
+def test_rutas_de_perfiles_no_generan_capturas(client, tmp_path):
+    client.get("/servicios/", headers={perfilado.CABECERA_PERFIL: SECRETO})
+    cabecera = {perfilado.CABECERA_PERFIL: SECRETO}
+
+    lista = client.get("/perfiles/", headers=cabecera).json()
+    assert len(lista) == 1
+    assert client.get(f"/perfiles/{lista[0]['nombre']}", headers=cabecera).status_code == 200
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_perfiles_requieren_secreto(client):
+    assert client.get("/perfiles/").status_code == 403
+    assert client.get("/perfiles/main.py", headers={perfilado.CABECERA_PERFIL: SECRETO}).status_code == 404
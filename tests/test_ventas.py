@@ -0,0 +1,167 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import MongoClient
+from pymongo.errors import AutoReconnect
+
+import main
+from crud import reconciliar_ventas
+from schemas import VentaSchema
+
+# Con MONGO_TEST_URL se usa un MongoDB real; si no, mongomock
+MONGO_TEST_URL = os.getenv("MONGO_TEST_URL")
+
+
+class ColeccionSegura:
+    """
+    mongomock no es thread-safe: cada operación se ejecuta bajo un lock,
+    igual que MongoDB aplica cada update de forma atómica por documento.
+    """
+
+    def __init__(self, col, lock):
+        self._col = col
+        self._lock = lock
+
+    def __getattr__(self, nombre):
+        attr = getattr(self._col, nombre)
+        if not callable(attr):
+            return attr
+
+        def llamada(*args, **kwargs):
+            with self._lock:
+                res = attr(*args, **kwargs)
+                return list(res) if isinstance(res, mongomock.collection.Cursor) else res
+        return llamada
+
+
+@pytest.fixture
+def cols(monkeypatch):
+    if MONGO_TEST_URL:
+        db = MongoClient(MONGO_TEST_URL)[f"test_ventas_{ObjectId()}"]
+        productos, ventas = db["productos"], db["ventas"]
+    else:
+        db = mongomock.MongoClient().db
+        lock = threading.RLock()
+        productos, ventas = ColeccionSegura(db["productos"], lock), ColeccionSegura(db["ventas"], lock)
+    monkeypatch.setattr(main, "productos_col", productos)
+    monkeypatch.setattr(main, "ventas_col", ventas)
+    yield productos, ventas
+    if MONGO_TEST_URL:
+        db.client.drop_database(db.name)
+
+
+def _crear_productos(productos, stocks):
+    ids = []
+    for i, stock in enumerate(stocks):
+        ids.append(productos.insert_one(
+            {"nombre_producto": f"Producto {i}", "precio": 1000, "stock": stock}
+        ).inserted_id)
+    return ids
+
+
+def _vender(items):
+    try:
+        main.crear_venta(VentaSchema(items=[{"id_producto": str(oid), "cantidad": c} for oid, c in items]))
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+
+def test_carritos_concurrentes_no_dejan_stock_negativo(cols):
+    productos, ventas = cols
+    iniciales = dict(zip(_crear_productos(productos, [3, 5, 2, 8, 1]), [3, 5, 2, 8, 1]))
+    ids = list(iniciales)
+
+    rnd = random.Random(42)
+    carritos = [
+        [(oid, rnd.randint(1, 2)) for oid in rnd.sample(ids, rnd.randint(1, 3))]
+        for _ in range(300)
+    ]
+    with ThreadPoolExecutor(32) as ex:
+        estados = list(ex.map(_vender, carritos))
+
+    assert set(estados) <= {200, 409}
+    assert 200 in estados and 409 in estados
+
+    vendidos = {oid: 0 for oid in ids}
+    for v in ventas.find({"estado": "completada"}):
+        for item in v["items"]:
+            vendidos[item["id_producto"]] += item["cantidad"]
+
+    for p in productos.find():
+        assert p["stock"] >= 0
+        assert p["stock"] + vendidos[p["_id"]] == iniciales[p["_id"]]
+        assert not p.get("ventas_pendientes")
+    assert ventas.count_documents({"estado": "pendiente"}) == 0
+    assert ventas.count_documents({"estado": "completada"}) == estados.count(200)
+
+
+def test_carrito_sin_stock_revierte_los_productos_descontados(cols):
+    productos, ventas = cols
+    a, b = _crear_productos(productos, [5, 1])
+
+    assert _vender([(a, 2), (b, 2)]) == 409
+    assert productos.find_one({"_id": a})["stock"] == 5
+    assert productos.find_one({"_id": b})["stock"] == 1
+    assert ventas.find_one()["estado"] == "rechazada"
+
+
+def test_error_de_mongo_en_bulk_write_revierte_la_venta(cols, monkeypatch):
+    productos, ventas = cols
+    a, b = _crear_productos(productos, [5, 5])
+    bulk_write = productos.bulk_write
+
+    class ProductosConCaida:
+        # El primer bulk_write se aplica en el servidor pero el cliente recibe un error
+        caido = False
+
+        def __getattr__(self, nombre):
+            return getattr(productos, nombre)
+
+        def bulk_write(self, *args, **kwargs):
+            res = bulk_write(*args, **kwargs)
+            if not self.caido:
+                self.caido = True
+                raise AutoReconnect("conexión perdida")
+            return res
+
+    monkeypatch.setattr(main, "productos_col", ProductosConCaida())
+    with pytest.raises(HTTPException) as exc:
+        main.crear_venta(VentaSchema(items=[{"id_producto": str(a), "cantidad": 2}, {"id_producto": str(b), "cantidad": 1}]))
+    assert exc.value.status_code == 503
+    # El error del driver (hosts, topología) no se expone al cliente
+    assert "conexión perdida" not in exc.value.detail
+    assert productos.find_one({"_id": a})["stock"] == 5
+    assert productos.find_one({"_id": b})["stock"] == 5
+    assert productos.count_documents({"ventas_pendientes": {"$exists": True, "$ne": []}}) == 0
+    assert ventas.find_one()["estado"] == "rechazada"
+
+
+def test_reconciliar_revierte_pendientes_antiguas_y_limpia_marcas(cols):
+    productos, ventas = cols
+    a, b = _crear_productos(productos, [3, 3])
+    antigua = (datetime.now() - timedelta(hours=1)).isoformat()
+
+    # Caída después de descontar stock: venta pendiente con marca
+    pendiente = {"_id": ObjectId(), "items": [{"id_producto": a, "cantidad": 2}], "fecha": antigua, "estado": "pendiente"}
+    ventas.insert_one(pendiente)
+    productos.update_one({"_id": a}, {"$inc": {"stock": -2}, "$push": {"ventas_pendientes": pendiente["_id"]}})
+
+    # Caída después de completar: la marca quedó en el producto
+    completada = {"_id": ObjectId(), "items": [{"id_producto": b, "cantidad": 1}], "fecha": antigua, "estado": "completada"}
+    ventas.insert_one(completada)
+    productos.update_one({"_id": b}, {"$inc": {"stock": -1}, "$push": {"ventas_pendientes": completada["_id"]}})
+
+    assert reconciliar_ventas(productos, ventas) == 1
+    assert productos.find_one({"_id": a})["stock"] == 3
+    assert productos.find_one({"_id": b})["stock"] == 2
+    assert productos.count_documents({"ventas_pendientes": {"$exists": True, "$ne": []}}) == 0
+    assert ventas.find_one({"_id": pendiente["_id"]})["estado"] == "rechazada"
+    assert ventas.find_one({"_id": completada["_id"]})["estado"] == "completada"